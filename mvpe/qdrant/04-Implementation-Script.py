@@ -11,6 +11,8 @@ Usage:
     python qdrant-setup.py --populate       # Populate with sample data
     python qdrant-setup.py --test          # Test search functionality
     python qdrant-setup.py --upload-docs   # Upload existing documentation
+    python qdrant-setup.py --rebuild       # Zero-downtime rebuild behind the collection alias
+    python qdrant-setup.py --serve         # Resident search service with warm clients
 """
 
 import os
@@ -18,16 +20,30 @@ import json
 import uuid
 import argparse
 import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Sequence
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields as dataclass_fields
 
+import numpy as np
 import openai
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client.models import (
+    CollectionStatus, CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation, OptimizersConfigDiff
+)
 from qdrant_client.http import models
 
 
+# Prime modulus of the MinHash permutations, small enough for uint64 products
+MINHASH_PRIME = (1 << 31) - 1
+
+
 @dataclass
 class Article:
     """Represents a knowledge base article"""
@@ -38,6 +54,65 @@ class Article:
     roles: List[str]
     source: str
     language: str = "en"
+    sources: List[str] = field(default_factory=list)  # All sources of near-duplicate chunks
+
+
+@dataclass
+class SearchResult:
+    """Compact search hit, only the requested payload fields are set"""
+    id: str
+    score: float
+    title: Optional[str] = None
+    content: Optional[str] = None
+    phase: Optional[str] = None
+    tags: Optional[List[str]] = None
+    roles: Optional[List[str]] = None
+    source: Optional[str] = None
+    sources: Optional[List[str]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Dict of the fields that are set, for JSON responses"""
+        return {f.name: getattr(self, f.name) for f in dataclass_fields(self) if getattr(self, f.name) is not None}
+
+
+# Payload fields a search can project, and the fields returned by default
+PAYLOAD_FIELDS = tuple(f.name for f in dataclass_fields(SearchResult) if f.name not in ("id", "score"))
+RESULT_FIELDS = ("title", "content", "phase", "tags", "roles")
+
+
+class ContentStore:
+    """Local SQLite store of full chunk text keyed by point ID, so it can be left out of the Qdrant payload"""
+    
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS content (id TEXT PRIMARY KEY, content TEXT NOT NULL, collection TEXT)")
+        # Stores created before rows were tagged with their collection
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(content)")]
+        if "collection" not in columns:
+            self._db.execute("ALTER TABLE content ADD COLUMN collection TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS content_collection ON content (collection)")
+
+    def put_many(self, collection_name: str, items: List[tuple]):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO content (id, content, collection) VALUES (?, ?, ?)",
+                [(point_id, content, collection_name) for point_id, content in items]
+            )
+
+    def delete_collection(self, collection_name: str):
+        """Delete the content of all points of a dropped collection"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM content WHERE collection = ?", (collection_name,))
+
+    def get_many(self, ids: List[str]) -> Dict[str, str]:
+        """Fetch the content of many points in one query"""
+        if not ids:
+            return {}
+        placeholders = ",".join("?" for _ in ids)
+        with self._lock:
+            rows = self._db.execute(f"SELECT id, content FROM content WHERE id IN ({placeholders})", ids).fetchall()
+        return dict(rows)
 
 
 class QdrantMCPSetup:
@@ -47,6 +122,19 @@ class QdrantMCPSetup:
         self.client = QdrantClient(url=qdrant_url, api_key=api_key)
         self.collection_name = collection_name
         self.embedding_model = "text-embedding-3-small"
+        # text-embedding-3-small returns 1536 dimensions unless shortened with the dimensions parameter
+        self.embedding_dimensions = 768
+        self.embedding_batch_size = 100
+        self.upload_batch_size = 256
+
+        # Optional local store of the chunk text, which is then left out of the payload
+        self.content_store: Optional[ContentStore] = None
+
+        # Near-duplicate detection of chunks before embedding (None disables it)
+        # A one-line edit of an 800-character chunk scores about 0.88 on 3-word shingles, but only 0.82 on 5-word ones
+        self.dedup_threshold: Optional[float] = 0.8
+        self.shingle_size = 3
+        self.minhash_permutations = 128
         
         # Event phases for categorization
         self.event_phases = {
@@ -72,18 +160,33 @@ class QdrantMCPSetup:
             "api", "auth", "analytics", "automation"
         ]
 
+    def _vectors_config(self) -> VectorParams:
+        """Vector configuration shared by all versions of the collection"""
+        return VectorParams(
+            size=self.embedding_dimensions,
+            distance=Distance.COSINE
+        )
+
+    def _alias_exists(self) -> bool:
+        """Check whether the collection name is served through an alias"""
+        aliases = self.client.get_aliases().aliases
+        return any(alias.alias_name == self.collection_name for alias in aliases)
+
     def setup_collection(self) -> bool:
         """Create and configure the Qdrant collection"""
         try:
+            if self._alias_exists():
+                print(f"❌ '{self.collection_name}' is an alias, use --rebuild to rebuild it without downtime")
+                return False
+
             print(f"🔧 Setting up collection '{self.collection_name}'...")
             
             # Recreate collection with optimal settings
+            if self.content_store is not None:
+                self.content_store.delete_collection(self.collection_name)
             self.client.recreate_collection(
                 collection_name=self.collection_name,
-                vectors_config=VectorParams(
-                    size=768,  # OpenAI text-embedding-3-small
-                    distance=Distance.COSINE
-                )
+                vectors_config=self._vectors_config()
             )
             
             print(f"✅ Collection '{self.collection_name}' created successfully!")
@@ -98,13 +201,31 @@ class QdrantMCPSetup:
         try:
             response = openai.embeddings.create(
                 model=self.embedding_model,
-                input=text
+                input=text,
+                dimensions=self.embedding_dimensions
             )
             return response.data[0].embedding
         except Exception as e:
             print(f"❌ Error generating embedding: {e}")
             return []
 
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate OpenAI embeddings for many texts in batched requests"""
+        embeddings = []
+        for start in range(0, len(texts), self.embedding_batch_size):
+            batch = texts[start:start + self.embedding_batch_size]
+            try:
+                response = openai.embeddings.create(
+                    model=self.embedding_model,
+                    input=batch,
+                    dimensions=self.embedding_dimensions
+                )
+                embeddings.extend(item.embedding for item in response.data)
+            except Exception as e:
+                print(f"❌ Error generating embeddings: {e}")
+                embeddings.extend([] for _ in batch)
+        return embeddings
+
     def create_sample_articles(self) -> List[Article]:
         """Create sample event management articles"""
         return [
@@ -212,40 +333,60 @@ class QdrantMCPSetup:
             )
         ]
 
-    def upload_articles(self, articles: List[Article]) -> bool:
-        """Upload articles to Qdrant collection"""
+    def upload_articles(self, articles: List[Article], collection_name: Optional[str] = None,
+                        require_all: bool = False) -> bool:
+        """Upload articles to Qdrant collection, failing when require_all is set and any embedding failed"""
+        collection_name = collection_name or self.collection_name
         try:
             print(f"📤 Uploading {len(articles)} articles to Qdrant...")
             
+            # Generate embeddings in batches
+            embeddings = self.get_embeddings([article.content for article in articles])
+            missing = sum(1 for embedding in embeddings if not embedding)
+            if require_all and (missing or not articles):
+                print(f"❌ {missing} of {len(articles)} embeddings failed, nothing uploaded")
+                return False
+
             points = []
-            for article in articles:
-                # Generate embedding
-                embedding = self.get_embedding(article.content)
+            contents = []
+            for article, embedding in zip(articles, embeddings):
                 if not embedding:
                     continue
                 
+                # Create point
+                payload = {
+                    "title": article.title,
+                    "content": article.content,
+                    "phase": article.phase,
+                    "tags": article.tags,
+                    "roles": article.roles,
+                    "source": article.source,
+                    "sources": article.sources or [article.source],
+                    "language": article.language,
+                    "created_at": "2025-01-17T00:00:00Z"
+                }
+                if self.content_store is not None:
+                    payload.pop("content")
+                
                 # Create point
                 point = PointStruct(
                     id=str(uuid.uuid4()),
                     vector=embedding,
-                    payload={
-                        "title": article.title,
-                        "content": article.content,
-                        "phase": article.phase,
-                        "tags": article.tags,
-                        "roles": article.roles,
-                        "source": article.source,
-                        "language": article.language,
-                        "created_at": "2025-01-17T00:00:00Z"
-                    }
+                    payload=payload
                 )
                 points.append(point)
+                contents.append((point.id, article.content))
             
-            # Upload to Qdrant
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
+            # Keep the full text in the local content store
+            if self.content_store is not None:
+                self.content_store.put_many(collection_name, contents)
+            
+            # Upload to Qdrant in batches
+            for start in range(0, len(points), self.upload_batch_size):
+                self.client.upsert(
+                    collection_name=collection_name,
+                    points=points[start:start + self.upload_batch_size]
+                )
             
             print(f"✅ Successfully uploaded {len(points)} articles!")
             return True
@@ -256,67 +397,107 @@ class QdrantMCPSetup:
 
     def search_knowledge_base(self, query: str, limit: int = 5, 
                             phase: Optional[str] = None, 
-                            role: Optional[str] = None) -> List[Dict]:
-        """Search the knowledge base with optional filters"""
+                            role: Optional[str] = None,
+                            collection_name: Optional[str] = None,
+                            fields: Optional[Sequence[str]] = None) -> List[SearchResult]:
+        """Search the knowledge base with optional filters, returning only the requested payload fields"""
+        fields = self._validate_fields(fields)
         try:
             # Generate query embedding
             query_embedding = self.get_embedding(query)
             if not query_embedding:
                 return []
             
-            # Build filter if needed
-            query_filter = None
-            if phase or role:
-                must_conditions = []
-                
-                if phase:
-                    must_conditions.append(
-                        FieldCondition(key="phase", match=MatchValue(value=phase))
-                    )
-                
-                if role:
-                    must_conditions.append(
-                        FieldCondition(key="roles", match=MatchValue(value=role))
-                    )
-                
-                if must_conditions:
-                    query_filter = Filter(must=must_conditions)
-            
             # Search Qdrant
             results = self.client.search(
-                collection_name=self.collection_name,
+                collection_name=collection_name or self.collection_name,
                 query_vector=query_embedding,
-                query_filter=query_filter,
+                query_filter=self._build_filter(phase, role),
                 limit=limit,
-                with_payload=True
+                with_payload=self._payload_selector(fields)
             )
             
-            return [
-                {
-                    "id": result.id,
-                    "title": result.payload["title"],
-                    "content": result.payload["content"],
-                    "phase": result.payload["phase"],
-                    "tags": result.payload["tags"],
-                    "roles": result.payload["roles"],
-                    "score": result.score
-                }
-                for result in results
-            ]
+            return self.load_content(self._format_results(results, fields), fields,
+                                     collection_name=collection_name or self.collection_name)
             
         except Exception as e:
             print(f"❌ Error searching knowledge base: {e}")
             return []
 
+    @staticmethod
+    def _build_filter(phase: Optional[str] = None, role: Optional[str] = None) -> Optional[Filter]:
+        """Build the search filter for the optional phase and role"""
+        must_conditions = []
+        
+        if phase:
+            must_conditions.append(
+                FieldCondition(key="phase", match=MatchValue(value=phase))
+            )
+        
+        if role:
+            must_conditions.append(
+                FieldCondition(key="roles", match=MatchValue(value=role))
+            )
+        
+        return Filter(must=must_conditions) if must_conditions else None
+
+    @staticmethod
+    def _validate_fields(fields: Optional[Sequence[str]]) -> tuple:
+        """Requested payload fields, the default result fields if none are given"""
+        fields = tuple(fields or RESULT_FIELDS)
+        unknown = set(fields) - set(PAYLOAD_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return fields
+
+    def _payload_selector(self, fields: tuple):
+        """Payload keys to fetch from Qdrant, offloaded content is fetched from the content store instead"""
+        keys = [key for key in fields if not (key == "content" and self.content_store is not None)]
+        return keys or False
+
+    @staticmethod
+    def _format_results(results, fields: tuple) -> List[SearchResult]:
+        """Convert scored points into compact search results"""
+        return [
+            SearchResult(
+                str(result.id),
+                result.score,
+                **{key: (result.payload or {}).get(key) for key in fields}
+            )
+            for result in results
+        ]
+
+    def load_content(self, results: List[SearchResult], fields: Sequence[str] = ("content",),
+                     collection_name: Optional[str] = None) -> List[SearchResult]:
+        """Fill in offloaded content for all results with one content store query.
+        Points missing from the store, e.g. uploaded without it, fall back to their payload content."""
+        if self.content_store is None or "content" not in fields:
+            return results
+        contents = self.content_store.get_many([result.id for result in results])
+        missing = [result.id for result in results if result.id not in contents]
+        if missing:
+            points = self.client.retrieve(
+                collection_name=collection_name or self.collection_name,
+                ids=missing,
+                with_payload=["content"]
+            )
+            contents.update((str(point.id), (point.payload or {}).get("content")) for point in points)
+        for result in results:
+            result.content = contents.get(result.id)
+        return results
+
+    # Benchmark queries used for testing and for warming up rebuilt collections
+    test_queries = [
+        ("How do I handle ticket refunds?", None, None),
+        ("What's the best way to track sponsor ROI?", "III.Sponsorships", "Finance"),
+        ("How to automate WhatsApp marketing?", "IV.Marketing", "Marketing"),
+        ("Event day operations checklist", "VII.Live-Event", "Operations"),
+        ("Stripe payment integration", "V.Ticketing", "Finance")
+    ]
+
     def test_search_queries(self):
         """Test various search queries to validate functionality"""
-        test_queries = [
-            ("How do I handle ticket refunds?", None, None),
-            ("What's the best way to track sponsor ROI?", "III.Sponsorships", "Finance"),
-            ("How to automate WhatsApp marketing?", "IV.Marketing", "Marketing"),
-            ("Event day operations checklist", "VII.Live-Event", "Operations"),
-            ("Stripe payment integration", "V.Ticketing", "Finance")
-        ]
+        test_queries = self.test_queries
         
         print("\n🔍 Testing search functionality...")
         print("=" * 50)
@@ -328,17 +509,102 @@ class QdrantMCPSetup:
             if role:
                 print(f"   Role: {role}")
             
-            results = self.search_knowledge_base(query, limit=3, phase=phase, role=role)
+            results = self.search_knowledge_base(query, limit=3, phase=phase, role=role,
+                                                 fields=("title", "phase", "tags"))
             
             if results:
                 for i, result in enumerate(results, 1):
-                    print(f"   {i}. {result['title']} (Score: {result['score']:.3f})")
-                    print(f"      Phase: {result['phase']} | Tags: {', '.join(result['tags'])}")
+                    print(f"   {i}. {result.title} (Score: {result.score:.3f})")
+                    print(f"      Phase: {result.phase} | Tags: {', '.join(result.tags or [])}")
             else:
                 print("   No results found")
         
         print("\n✅ Search testing completed!")
 
+    def rebuild_collection(self, articles: List[Article], warm: bool = True, keep_versions: int = 2,
+                           optimize_timeout: float = 600) -> bool:
+        """Build a new collection version and swap the alias to it without a search outage"""
+        alias = self.collection_name
+        version = f"{alias}-v{time.strftime('%Y%m%d%H%M%S')}"
+        if not articles:
+            print("❌ No articles to rebuild the collection from, keeping the current version")
+            return False
+        swapped = False
+        try:
+            print(f"🔧 Building collection '{version}' behind alias '{alias}'...")
+
+            # Skip HNSW indexing during the bulk load, the index is built once afterwards
+            self.client.create_collection(
+                collection_name=version,
+                vectors_config=self._vectors_config(),
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=0)
+            )
+            # Any shortfall aborts the rebuild, the alias must never point to a partial version
+            if not self.upload_articles(articles, collection_name=version, require_all=True):
+                raise RuntimeError("upload failed")
+            uploaded = self.client.count(collection_name=version, exact=True).count
+            if uploaded != len(articles):
+                raise RuntimeError(f"only {uploaded} of {len(articles)} articles were uploaded")
+
+            self.client.update_collection(
+                collection_name=version,
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=20000)
+            )
+            deadline = time.monotonic() + optimize_timeout
+            while self.client.get_collection(version).status == CollectionStatus.YELLOW:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"collection '{version}' did not finish optimizing in {optimize_timeout:.0f}s")
+                time.sleep(1)
+            if self.client.get_collection(version).status == CollectionStatus.RED:
+                raise RuntimeError(f"collection '{version}' failed to optimize")
+
+            if warm:
+                print("🔥 Warming up with the benchmark queries...")
+                for query, phase, role in self.test_queries:
+                    self.search_knowledge_base(query, limit=3, phase=phase, role=role,
+                                               collection_name=version, fields=("title",))
+
+            operations = [CreateAliasOperation(create_alias=CreateAlias(collection_name=version, alias_name=alias))]
+            if self._alias_exists():
+                operations.insert(0, DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+            elif self.client.collection_exists(alias):
+                # One-time migration from a plain collection, an alias cannot share its name
+                print(f"⚠️  Replacing the plain collection '{alias}' with an alias")
+                self._delete_collection(alias)
+            self.client.update_collection_aliases(change_aliases_operations=operations)
+            swapped = True
+            print(f"✅ Alias '{alias}' now points to '{version}'")
+
+            self._delete_old_versions(version, keep_versions)
+            return True
+
+        except Exception as e:
+            print(f"❌ Error rebuilding collection: {e}")
+            if not swapped and self.client.collection_exists(version):
+                print(f"🗑️  Deleting the incomplete collection version '{version}'")
+                self._delete_collection(version)
+            return False
+
+    def _delete_collection(self, name: str):
+        """Delete a collection together with its rows in the content store"""
+        self.client.delete_collection(name)
+        if self.content_store is not None:
+            self.content_store.delete_collection(name)
+
+    def _delete_old_versions(self, active: str, keep_versions: int):
+        """Delete all but the newest collection versions, never the active one"""
+        # Only names generated by rebuild_collection, e.g. not an unrelated 'event-kb-vendors'
+        version_name = re.compile(rf"{re.escape(self.collection_name)}-v\d{{14}}")
+        versions = sorted(
+            (collection.name for collection in self.client.get_collections().collections
+             if version_name.fullmatch(collection.name)),
+            reverse=True
+        )
+        for name in versions[max(keep_versions, 1):]:
+            if name != active:
+                print(f"🗑️  Deleting old collection version '{name}'")
+                self._delete_collection(name)
+
     def process_markdown_docs(self, docs_path: str) -> List[Article]:
         """Process existing markdown documentation"""
         articles = []
@@ -387,8 +653,86 @@ class QdrantMCPSetup:
                 continue
         
         print(f"✅ Processed {len(articles)} articles from documentation")
+
+        if self.dedup_threshold is not None:
+            articles = self.deduplicate_articles(articles, self.dedup_threshold)
+
         return articles
 
+    def _minhash_signature(self, content: str, a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+        """MinHash signature over the word shingles of the content"""
+        words = re.findall(r"\w+", content.lower())
+        if not words:
+            return None
+        size = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingles],
+            dtype=np.uint64
+        ) % MINHASH_PRIME
+        return ((a[:, None] * hashes[None, :] + b[:, None]) % MINHASH_PRIME).min(axis=1)
+
+    def _lsh_rows(self, threshold: float) -> int:
+        """Rows per LSH band, so that pairs somewhat below the threshold still become candidates"""
+        rows = 1
+        for candidate in range(1, self.minhash_permutations + 1):
+            bands = self.minhash_permutations // candidate
+            if (1 / bands) ** (1 / candidate) <= max(threshold - 0.1, 0.05):
+                rows = candidate
+        return rows
+
+    def deduplicate_articles(self, articles: List[Article], threshold: float = 0.8) -> List[Article]:
+        """Collapse near-duplicate chunks (MinHash Jaccard similarity >= threshold) into one article"""
+        rng = np.random.default_rng(42)
+        a = rng.integers(1, MINHASH_PRIME, self.minhash_permutations, dtype=np.uint64)
+        b = rng.integers(0, MINHASH_PRIME, self.minhash_permutations, dtype=np.uint64)
+        signatures = [self._minhash_signature(article.content, a, b) for article in articles]
+
+        # Candidate pairs share at least one LSH band
+        rows = self._lsh_rows(threshold)
+        buckets: Dict[tuple, List[int]] = {}
+        for index, signature in enumerate(signatures):
+            if signature is None:
+                continue
+            for band in range(self.minhash_permutations // rows):
+                key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+                buckets.setdefault(key, []).append(index)
+
+        # Union-find over the candidate pairs that pass the threshold
+        parent = list(range(len(articles)))
+
+        def find(index: int) -> int:
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        for members in buckets.values():
+            for position, other in enumerate(members[1:], start=1):
+                for member in members[:position]:
+                    member_root, other_root = find(member), find(other)
+                    if member_root == other_root:
+                        break
+                    if np.mean(signatures[member] == signatures[other]) >= threshold:
+                        parent[max(member_root, other_root)] = min(member_root, other_root)
+                        break
+
+        # Keep the first article of each group and list the sources of all its duplicates
+        deduplicated = []
+        groups: Dict[int, Article] = {}
+        for index, article in enumerate(articles):
+            root = find(index)
+            if root not in groups:
+                article.sources = [article.source]
+                groups[root] = article
+                deduplicated.append(article)
+            elif article.source not in groups[root].sources:
+                groups[root].sources.append(article.source)
+
+        print(f"🧹 Collapsed {len(articles) - len(deduplicated)} near-duplicate chunks "
+              f"({len(deduplicated)} unique chunks left)")
+        return deduplicated
+
     def _determine_phase(self, content: str) -> str:
         """Determine event phase from content"""
         content_lower = content.lower()
@@ -461,6 +805,141 @@ class QdrantMCPSetup:
 }}'''
 
 
+class KnowledgeBaseSearchService:
+    """Resident search service with warm clients, an embedding cache and request coalescing"""
+    
+    def __init__(self, setup: QdrantMCPSetup, qdrant_url: str, api_key: str,
+                 prefer_grpc: bool = True, cache_size: int = 1024):
+        self.setup = setup
+        self.client = AsyncQdrantClient(url=qdrant_url, api_key=api_key, prefer_grpc=prefer_grpc)
+        self.openai = openai.AsyncOpenAI()
+        self.cache_size = cache_size
+        self.embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.in_flight: Dict[tuple, asyncio.Future] = {}
+        self.ready = False
+        self.warm_up_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> bool:
+        """Open the connections and preload the caches with the benchmark queries"""
+        print("🔥 Warming up search service...")
+        try:
+            await self.client.get_collection(self.setup.collection_name)
+            for query, phase, role in self.setup.test_queries:
+                await self.search(query, limit=3, phase=phase, role=role, fields=("title",))
+        except Exception as e:
+            print(f"⚠️  Search service warm-up failed: {e}")
+            return False
+        self.ready = True
+        print("✅ Search service ready")
+        return True
+
+    async def warm_up(self, initial_delay: float = 1.0, max_delay: float = 60.0):
+        """Retry the warm-up with exponential backoff until it succeeds, e.g. when Qdrant is not reachable yet"""
+        delay = initial_delay
+        while not await self.start():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    async def close(self):
+        if self.warm_up_task is not None:
+            self.warm_up_task.cancel()
+        await self.client.close()
+        await self.openai.close()
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Collapse whitespace only, embeddings are case sensitive"""
+        return " ".join(query.split())
+
+    async def embed(self, query: str) -> List[float]:
+        """Query embedding from the LRU cache, or from OpenAI"""
+        key = self._normalize_query(query)
+        if key in self.embedding_cache:
+            self.embedding_cache.move_to_end(key)
+            return self.embedding_cache[key]
+        
+        response = await self.openai.embeddings.create(
+            model=self.setup.embedding_model,
+            input=key,
+            dimensions=self.setup.embedding_dimensions
+        )
+        embedding = response.data[0].embedding
+        self.embedding_cache[key] = embedding
+        if len(self.embedding_cache) > self.cache_size:
+            self.embedding_cache.popitem(last=False)
+        return embedding
+
+    async def search(self, query: str, limit: int = 5,
+                     phase: Optional[str] = None, role: Optional[str] = None,
+                     fields: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Search, sharing one request between identical in-flight queries"""
+        fields = self.setup._validate_fields(fields)
+        query = self._normalize_query(query)
+        key = (query, limit, phase, role, fields)
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._search(query, limit, phase, role, fields))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shield the shared search from a single caller disconnecting
+        return await asyncio.shield(task)
+
+    async def _search(self, query: str, limit: int, phase: Optional[str], role: Optional[str],
+                      fields: tuple) -> List[Dict]:
+        results = await self.client.search(
+            collection_name=self.setup.collection_name,
+            query_vector=await self.embed(query),
+            query_filter=self.setup._build_filter(phase, role),
+            limit=limit,
+            with_payload=self.setup._payload_selector(fields)
+        )
+        results = self.setup._format_results(results, fields)
+        if self.setup.content_store is not None and "content" in fields:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.setup.load_content, results, fields, self.setup.collection_name
+            )
+        return [result.to_dict() for result in results]
+
+    def create_app(self):
+        """Create the HTTP app serving /search, /healthz and /readyz"""
+        from contextlib import asynccontextmanager
+        from fastapi import FastAPI, HTTPException, Query
+        
+        @asynccontextmanager
+        async def lifespan(app: FastAPI):
+            # Serve /healthz right away and report ready once the background warm-up succeeds
+            self.warm_up_task = asyncio.ensure_future(self.warm_up())
+            yield
+            await self.close()
+        
+        app = FastAPI(title="EventOS Knowledge Base Search", lifespan=lifespan)
+        
+        @app.get("/search")
+        async def search(query: str, limit: int = Query(5, ge=1, le=100),
+                         phase: Optional[str] = None, role: Optional[str] = None,
+                         fields: Optional[str] = Query(None, description="Comma-separated payload fields")):
+            field_list = [key.strip() for key in fields.split(",") if key.strip()] if fields else None
+            try:
+                return {"results": await self.search(query, limit=limit, phase=phase, role=role, fields=field_list)}
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except Exception as e:
+                print(f"❌ Error searching knowledge base: {e}")
+                raise HTTPException(status_code=502, detail="Search backend unavailable")
+        
+        @app.get("/healthz")
+        async def healthz():
+            return {"status": "ok"}
+        
+        @app.get("/readyz")
+        async def readyz():
+            if not self.ready:
+                raise HTTPException(status_code=503, detail="Warming up")
+            return {"status": "ready", "cached_embeddings": len(self.embedding_cache)}
+        
+        return app
+
+
 def main():
     """Main function to run the setup script"""
     parser = argparse.ArgumentParser(description="Qdrant MCP Setup for EventOS")
@@ -468,6 +947,15 @@ def main():
     parser.add_argument("--populate", action="store_true", help="Populate with sample data")
     parser.add_argument("--test", action="store_true", help="Test search functionality")
     parser.add_argument("--upload-docs", type=str, help="Upload documentation from path")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild sample data and --upload-docs into a new version behind the collection alias")
+    parser.add_argument("--no-warm", action="store_true", help="Skip warming up the rebuilt collection")
+    parser.add_argument("--dedup-threshold", type=float, default=0.8, help="Similarity above which doc chunks are collapsed, 0 disables deduplication")
+    parser.add_argument("--serve", action="store_true", help="Run the resident search service")
+    parser.add_argument("--host", default="127.0.0.1", help="Search service host")
+    parser.add_argument("--port", type=int, default=8100, help="Search service port")
+    parser.add_argument("--no-grpc", action="store_true", help="Use HTTP instead of gRPC for the search service")
+    parser.add_argument("--content-store", type=str, help="SQLite file for chunk text, which is then left out of the Qdrant payload")
+    parser.add_argument("--keep-versions", type=int, default=2, help="Collection versions to keep after a rebuild")
     parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL"), help="Qdrant URL")
     parser.add_argument("--api-key", default=os.getenv("QDRANT_API_KEY"), help="Qdrant API Key")
     parser.add_argument("--collection", default="event-kb", help="Collection name")
@@ -482,6 +970,9 @@ def main():
     
     # Initialize setup
     setup = QdrantMCPSetup(args.qdrant_url, args.api_key, args.collection)
+    setup.dedup_threshold = args.dedup_threshold or None
+    if args.content_store:
+        setup.content_store = ContentStore(args.content_store)
     
     if args.setup:
         print("🚀 Setting up Qdrant MCP...")
@@ -495,7 +986,14 @@ def main():
         articles = setup.create_sample_articles()
         setup.upload_articles(articles)
     
-    if args.upload_docs:
+    if args.rebuild:
+        print("♻️  Rebuilding knowledge base...")
+        articles = setup.create_sample_articles()
+        if args.upload_docs:
+            articles += setup.process_markdown_docs(args.upload_docs)
+        setup.rebuild_collection(articles, warm=not args.no_warm, keep_versions=args.keep_versions)
+    
+    if args.upload_docs and not args.rebuild:
         print(f"📁 Uploading documentation from: {args.upload_docs}")
         articles = setup.process_markdown_docs(args.upload_docs)
         setup.upload_articles(articles)
@@ -504,7 +1002,13 @@ def main():
         print("🧪 Testing search functionality...")
         setup.test_search_queries()
     
-    if not any([args.setup, args.populate, args.test, args.upload_docs]):
+    if args.serve:
+        import uvicorn
+        print(f"🌐 Serving knowledge base search on http://{args.host}:{args.port}")
+        service = KnowledgeBaseSearchService(setup, args.qdrant_url, args.api_key, prefer_grpc=not args.no_grpc)
+        uvicorn.run(service.create_app(), host=args.host, port=args.port, log_level="warning")
+    
+    if not any([args.setup, args.populate, args.test, args.upload_docs, args.rebuild, args.serve]):
         parser.print_help()
 
 
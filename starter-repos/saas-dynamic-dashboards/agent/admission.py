@@ -0,0 +1,124 @@
+"""
+Admission control for the agent's model calls.
+Caps the number of concurrent model calls globally and per tenant, with a bounded wait queue
+so bursts are rejected quickly instead of piling up behind provider rate limits.
+"""
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict
+
+from instrumentation import metrics
+
+# Tenant of the current request, set by the FastAPI middleware and inherited by the graph tasks
+current_tenant: ContextVar[str] = ContextVar("current_tenant", default="default")
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a model call is not admitted, because the wait queue is full or its deadline passed.
+    """
+
+    def __init__(self, reason: str, tenant: str):
+        super().__init__(f"Model call rejected for tenant '{tenant}': {reason}")
+        self.reason = reason
+        self.tenant = tenant
+
+
+class AdmissionController:
+    """
+    Global and per-tenant concurrency limits with a bounded, deadline-aware wait queue.
+    """
+
+    def __init__(self, max_concurrency: int = 32, max_concurrency_per_tenant: int = 8,
+                 max_queue: int = 64, queue_timeout: float = 10.0):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_tenant = max_concurrency_per_tenant
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._tenants: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(max_concurrency_per_tenant))
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        # Admitted and waiting calls per tenant, the state of a tenant is dropped once it is idle
+        self._users: Dict[str, int] = defaultdict(int)
+        self._waiting = 0
+
+    def is_saturated(self) -> bool:
+        """
+        True when new requests would be rejected right away because the wait queue is full.
+        """
+        return self._waiting >= self.max_queue
+
+    def _report(self, tenant: str):
+        metrics.set_gauge("agent_admission_queue_depth", self._waiting)
+        metrics.set_gauge("agent_admission_in_flight", sum(self._in_flight.values()))
+        metrics.set_gauge("agent_admission_in_flight_tenant", self._in_flight[tenant], tenant=tenant)
+
+    def _reject(self, reason: str, tenant: str):
+        metrics.increment("agent_admission_rejected_total", reason=reason, tenant=tenant)
+        return AdmissionRejected(reason, tenant)
+
+    @asynccontextmanager
+    async def admit(self, tenant: str = None):
+        """
+        Wait for a global and a tenant slot before running the block.
+        Raises AdmissionRejected when the queue is full or no slot frees up before the deadline.
+        """
+        tenant = tenant or current_tenant.get()
+        tenant_semaphore = self._tenants[tenant]
+        self._users[tenant] += 1
+        try:
+            async with self._acquire(tenant, tenant_semaphore):
+                yield
+        finally:
+            self._users[tenant] -= 1
+            if not self._users[tenant]:
+                del self._users[tenant]
+                self._tenants.pop(tenant, None)
+                self._in_flight.pop(tenant, None)
+
+    @asynccontextmanager
+    async def _acquire(self, tenant: str, tenant_semaphore: asyncio.Semaphore):
+        """
+        Hold a tenant and a global slot for the duration of the block.
+        """
+        start = time.perf_counter()
+        deadline = start + self.queue_timeout
+        acquired = []
+        queued = False
+        try:
+            # Take the tenant slot first so a busy tenant does not hold global slots while waiting
+            for semaphore in (tenant_semaphore, self._global):
+                if semaphore.locked():
+                    if not queued:
+                        if self.is_saturated():
+                            raise self._reject("queue_full", tenant)
+                        queued = True
+                        self._waiting += 1
+                        self._report(tenant)
+                    await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - time.perf_counter()))
+                else:
+                    await semaphore.acquire()
+                acquired.append(semaphore)
+        except BaseException as e:
+            for semaphore in acquired:
+                semaphore.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("deadline", tenant) from None
+            raise
+        finally:
+            if queued:
+                self._waiting -= 1
+                metrics.observe("agent_admission_wait_seconds", time.perf_counter() - start)
+
+        self._in_flight[tenant] += 1
+        self._report(tenant)
+        try:
+            yield
+        finally:
+            self._in_flight[tenant] -= 1
+            for semaphore in acquired:
+                semaphore.release()
+            self._report(tenant)
@@ -1,13 +1,18 @@
 """
 A LangGraph implementation for the testing agent.
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 from copilotkit.integrations.fastapi import add_fastapi_endpoint
 from copilotkit import CopilotKitSDK, LangGraphAgent
 import os
 import uuid
 import json
+import asyncio
+import time
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime, timezone
 from typing import Dict, List, Any
 from dotenv import load_dotenv
 
@@ -25,9 +30,14 @@ from copilotkit.langgraph import copilotkit_customize_config, copilotkit_emit_st
 
 # LLM imports
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import AIMessage, SystemMessage
 from copilotkit.langgraph import (copilotkit_exit)
 
+from admission import AdmissionController, AdmissionRejected, current_tenant
+from instrumentation import metrics, model_call_metrics
+from model_router import ModelRouter
+from response_cache import TestScriptCache, cache_key, is_forced_regenerate
+
 DEFINE_TEST_SCRIPT_TOOL = {
     "type": "function",
     "function": {
@@ -41,7 +51,6 @@ DEFINE_TEST_SCRIPT_TOOL = {
                     "items": {
                         "type": "object",
                         "properties": {
-                            "testId": { "type": "string" },
                             "prId": { "type": "string" },
                             "title": { "type": "string" },
                             "status": { "type": "string", "enum": ["passed", "failed", "idle"] },
@@ -51,12 +60,9 @@ DEFINE_TEST_SCRIPT_TOOL = {
                                 "items": {
                                     "type": "object",
                                     "properties": {
-                                        "id": { "type": "string" },
                                         "name": { "type": "string" },
                                         "status": { "type": "string", "enum": ["passed", "failed", "idle", "pending"] },
                                         "executionTime": { "type": "string" },
-                                        "createdAt": { "type": "string", "format": "date-time" },
-                                        "updatedAt": { "type": "string", "format": "date-time" },
                                         "environment": { "type": "string" },
                                         "browser": { "type": "string" },
                                         "device": { "type": "string" },
@@ -67,40 +73,24 @@ DEFINE_TEST_SCRIPT_TOOL = {
                                         "failureReason": { "type": "string" }
                                     },
                                     "required": [
-                                        "id",
                                         "name",
                                         "status",
                                         "executionTime",
-                                        "createdAt",
-                                        "updatedAt",
                                         "environment",
                                         "testSteps",
                                     ]
                                 }
                             },
-                            "totalTestCases": { "type": "number" },
-                            "passedTestCases": { "type": "number" },
-                            "failedTestCases": { "type": "number" },
-                            "skippedTestCases": { "type": "number" },
                             "coverage": { "type": "number" },
-                            "createdAt": { "type": "string", "format": "date-time" },
-                            "updatedAt": { "type": "string", "format": "date-time" },
                             "executedBy": { "type": "string" }
                         },
                         "required": [
-                            "testId",
                             "prId",
                             "title",
                             "status",
                             "shortDescription",
                             "testCases",
-                            "totalTestCases",
-                            "passedTestCases",
-                            "failedTestCases",
-                            "skippedTestCases",
                             "coverage",
-                            "createdAt",
-                            "updatedAt",
                             "executedBy"
                         ]
                     }
@@ -111,13 +101,222 @@ DEFINE_TEST_SCRIPT_TOOL = {
     }
 }
 
+_SCHEMA_TYPES = {
+    "string": ((str,), str),
+    "number": ((int, float), int),
+    "array": ((list,), list),
+    "object": ((dict,), dict),
+}
+
+
+def _compile_required_fields(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map every required property of an object schema to its accepted Python types and a default factory.
+    """
+    return {
+        name: _SCHEMA_TYPES[schema["properties"][name]["type"]]
+        for name in schema.get("required", [])
+    }
+
+
+def _fill_required(item: Dict[str, Any], required_fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Default the required fields that are missing or have the wrong type.
+    """
+    filled = dict(item)
+    for name, (types, default) in required_fields.items():
+        value = filled.get(name)
+        if not isinstance(value, types) or isinstance(value, bool):
+            filled[name] = default()
+    return filled
+
+
+def _compile_test_script_normalizer(tool: Dict[str, Any]):
+    """
+    Build the normalizer for `generate_test_scripts` arguments once, from the tool schema.
+    The model only emits creative content; IDs, timestamps and the test case counts
+    are derived here so they are always consistent with the generated test cases.
+    Required fields the model left out are defaulted from the schema.
+    """
+    suite_schema = tool["function"]["parameters"]["properties"]["testSuites"]["items"]
+    case_schema = suite_schema["properties"]["testCases"]["items"]
+    suite_required = _compile_required_fields(suite_schema)
+    case_required = _compile_required_fields(case_schema)
+    suite_statuses = frozenset(suite_schema["properties"]["status"]["enum"])
+    case_statuses = frozenset(case_schema["properties"]["status"]["enum"])
+    skipped_statuses = case_statuses - {"passed", "failed"}
+
+    def normalize(tool_call_args: Dict[str, Any]) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc).isoformat()
+        test_suites = []
+        for suite_index, suite in enumerate(tool_call_args.get("testSuites") or [], start=1):
+            if not isinstance(suite, dict):
+                continue
+            suite = _fill_required(suite, suite_required)
+            suite["title"] = suite["title"] or f"Test Suite {suite_index}"
+            test_id = suite.get("testId") or f"TEST{uuid.uuid4().hex[:6].upper()}"
+            test_cases = []
+            for index, test_case in enumerate(suite["testCases"], start=1):
+                if not isinstance(test_case, dict):
+                    continue
+                test_case = _fill_required(test_case, case_required)
+                test_case["name"] = test_case["name"] or f"Test case {index}"
+                status = test_case.get("status")
+                test_cases.append({
+                    **test_case,
+                    "id": test_case.get("id") or f"{test_id}-{index}",
+                    "status": status if status in case_statuses else "idle",
+                    "testSteps": [str(step) for step in test_case["testSteps"]],
+                    "createdAt": test_case.get("createdAt") or now,
+                    "updatedAt": now,
+                })
+            statuses = [test_case["status"] for test_case in test_cases]
+            status = suite.get("status")
+            test_suites.append({
+                **suite,
+                "testId": test_id,
+                "status": status if status in suite_statuses else "idle",
+                "testCases": test_cases,
+                "totalTestCases": len(test_cases),
+                "passedTestCases": statuses.count("passed"),
+                "failedTestCases": statuses.count("failed"),
+                "skippedTestCases": sum(1 for s in statuses if s in skipped_statuses),
+                "createdAt": suite.get("createdAt") or now,
+                "updatedAt": now,
+            })
+        return {**tool_call_args, "testSuites": test_suites}
+
+    return normalize
+
+
+normalize_test_scripts = _compile_test_script_normalizer(DEFINE_TEST_SCRIPT_TOOL)
+
+# Optional fan-out path: plan the suite titles in one short call, then generate each suite concurrently
+TEST_SUITE_FANOUT = os.getenv("TEST_SUITE_FANOUT", "false").lower() in ("1", "true", "yes")
+TEST_SUITE_FANOUT_CONCURRENCY = int(os.getenv("TEST_SUITE_FANOUT_CONCURRENCY", "4"))
+TEST_SUITE_FANOUT_MAX_SUITES = int(os.getenv("TEST_SUITE_FANOUT_MAX_SUITES", "4"))
+
+PLAN_TEST_SUITES_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "plan_test_suites",
+        "description": "Plan 4 different test suites for a given task based on the context provided. Only the titles are planned here, the test suites are generated afterwards.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "prId": { "type": "string" },
+                "titles": {
+                    "type": "array",
+                    "items": { "type": "string" }
+                }
+            },
+            "required": ["prId", "titles"]
+        }
+    }
+}
+
+# Optional cache of generated test scripts for repeated requests on the same context
+TEST_SCRIPT_CACHE = os.getenv("TEST_SCRIPT_CACHE", "false").lower() in ("1", "true", "yes")
+test_script_cache = TestScriptCache(
+    max_size=int(os.getenv("TEST_SCRIPT_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("TEST_SCRIPT_CACHE_TTL", "3600")),
+) if TEST_SCRIPT_CACHE else None
+
+# Optional admission control in front of the model calls
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "false").lower() in ("1", "true", "yes")
+ADMISSION_TENANT_HEADER = os.getenv("ADMISSION_TENANT_HEADER", "x-tenant-id")
+# The tenant header is not authenticated, so only known tenants get their own limits
+ADMISSION_TENANTS = frozenset(filter(None, (tenant.strip() for tenant in os.getenv("ADMISSION_TENANTS", "").split(","))))
+admission = AdmissionController(
+    max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32")),
+    max_concurrency_per_tenant=int(os.getenv("ADMISSION_MAX_CONCURRENCY_PER_TENANT", "8")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+) if ADMISSION_CONTROL else None
+
+DEFINE_TEST_SUITE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "generate_test_suite",
+        "description": "Make up a single test suite for the given title based on the context provided.",
+        "parameters": DEFINE_TEST_SCRIPT_TOOL["function"]["parameters"]["properties"]["testSuites"]["items"],
+    }
+}
+
 class AgentState(CopilotKitState):
     """
     The state of the agent.
     It inherits from CopilotKitState which provides the basic fields needed by CopilotKit.
     """
     testScripts: List[Dict[str, str]] = []
+    testSuitePlan: Dict[str, Any] = {}
+    forceRegenerate: bool = False
+
+def create_model(model_name: str) -> ChatOpenAI:
+    """
+    Create a chat model. The router caches it so its HTTP client and connection pool are reused across requests.
+    """
+    return ChatOpenAI(model=model_name, callbacks=[model_call_metrics], stream_usage=True)
 
+
+def _parse_timeouts(value: str) -> Dict[str, float]:
+    timeouts = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, timeout = item.split("=", 1)
+            timeouts[name.strip()] = float(timeout)
+    return timeouts
+
+
+def admit_model_call():
+    """
+    Wait for an admission slot before a model call when admission control is enabled.
+    """
+    return admission.admit() if admission is not None else nullcontext()
+
+
+# gpt-4o-mini first, with gpt-4o as the secondary model for failures, timeouts and hedged requests
+model_router = ModelRouter(
+    model_names=[name.strip() for name in os.getenv("MODEL_ROUTER_MODELS", "gpt-4o-mini,gpt-4o").split(",") if name.strip()],
+    create_model=create_model,
+    timeouts=_parse_timeouts(os.getenv("MODEL_ROUTER_TIMEOUTS", "")),
+    default_timeout=float(os.getenv("MODEL_ROUTER_TIMEOUT", "90")),
+    hedge=os.getenv("MODEL_ROUTER_HEDGE", "false").lower() in ("1", "true", "yes"),
+    hedge_min_delay=float(os.getenv("MODEL_ROUTER_HEDGE_MIN_DELAY", "2")),
+    probe_interval=float(os.environ["MODEL_ROUTER_PROBE_INTERVAL"]) if os.getenv("MODEL_ROUTER_PROBE_INTERVAL") else None,
+    admit=admit_model_call,
+)
+
+
+def _normalize_title(title: str) -> str:
+    return " ".join(str(title).lower().split())
+
+
+def merge_test_suites(test_suites: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge independently generated test suites, dropping duplicate suites by title
+    and duplicate test cases by name within a suite.
+    """
+    merged = []
+    seen_titles = set()
+    for suite in test_suites:
+        title = _normalize_title(suite.get("title", ""))
+        if title in seen_titles:
+            continue
+        seen_titles.add(title)
+        seen_cases = set()
+        test_cases = []
+        for test_case in suite.get("testCases") or []:
+            name = _normalize_title(test_case.get("name", "")) if isinstance(test_case, dict) else None
+            if name is None or name in seen_cases:
+                continue
+            seen_cases.add(name)
+            test_cases.append(test_case)
+        merged.append({**suite, "testCases": test_cases})
+    return merged
+
+
+@metrics.node("start_flow")
 async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     """
     This is the entry point for the flow.
@@ -137,6 +336,7 @@ async def start_flow(state: Dict[str, Any], config: RunnableConfig):
     )
 
 
+@metrics.node("chat_node")
 async def chat_node(state: Dict[str, Any], config: RunnableConfig):
     """
     Standard chat node where the agent processes messages and generates responses.
@@ -150,47 +350,61 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
     For every agent request, YOU MUST ALWAYS GENERATE 4 DIFFERENT TEST SUITES, each as a separate object in the array. Each test suite should be relevant to the context which is the CopilotKitReadables or PR provided by the user, and should have unique test cases and details. All the data which involves the user emails should be referred from the CopilotKitReadables.
 
     The test suite object you work with has the following structure (all fields are required unless marked optional):
-    - testId: string
     - prId: string
     - title: string
     - status: 'passed' | 'failed' | 'idle'
     - shortDescription: string (a concise summary of what this test suite covers)
     - testCases: array of objects, each with:
-        - id: string
         - name: string
         - status: 'passed' | 'failed' | 'idle' | 'pending'
         - executionTime: string
-        - createdAt: string (date-time)
-        - updatedAt: string (date-time)
         - environment: string
         - browser?: string
         - device?: string
         - testSteps: array of strings
         - failureReason?: string
-    - totalTestCases: number
-    - passedTestCases: number
-    - failedTestCases: number
-    - skippedTestCases: number
     - coverage: number
-    - createdAt: string (date-time)
-    - updatedAt: string (date-time)
     - executedBy: string
 
+    Do not generate IDs, timestamps or test case counts; they are filled in automatically.
+
     When generating or reasoning about test scripts, always use this schema and ensure your output is relevant to the PR and test context provided by the user.
     """
 
-    # Define the model
-    
-    try:
-        model = ChatOpenAI(model="gpt-4o-mini")
-    except Exception as e:
-        print(e)
-        model = ChatOpenAI(model="gpt-4o")
-    
+    if TEST_SUITE_FANOUT:
+        system_prompt = """
+    You are a helpful assistant that can perform any task related to software testing and PR validation.
+    You MUST call the `plan_test_suites` function when the user asks you to perform a task.
+
+    For every agent request, YOU MUST ALWAYS PLAN 4 DIFFERENT TEST SUITE TITLES. Each title should be relevant to the context which is the CopilotKitReadables or PR provided by the user, and should not overlap with the other titles.
+    """
+
     # Define config for the model
     if config is None:
         config = RunnableConfig(recursion_limit=25)
-    
+
+    # Return the test scripts of an identical earlier request, unless the user asks to regenerate them
+    test_scripts_key = None
+    if test_script_cache is not None:
+        test_scripts_key = cache_key(state["messages"], state.get("copilotkit", {}).get("context"))
+        forced = state.get("forceRegenerate") or is_forced_regenerate(state["messages"])
+        cached_test_scripts = test_script_cache.get(test_scripts_key) if test_scripts_key and not forced else None
+        metrics.increment("agent_cache_requests_total", result="hit" if cached_test_scripts else "miss")
+        if cached_test_scripts is not None:
+            await copilotkit_emit_state(config, {**state, "testScripts": cached_test_scripts})
+            with metrics.timer("agent_stage_seconds", node="chat_node", stage="copilotkit_exit"):
+                await copilotkit_exit(config)
+            return Command(
+                goto=END,
+                update={
+                    "messages": state["messages"] + [AIMessage(content=(
+                        "These test suites were generated for the same request earlier. "
+                        "Select the ones you want to add to your testing list, or ask me to regenerate them."
+                    ))],
+                    "testScripts": cached_test_scripts,
+                }
+            )
+
     # Use CopilotKit's custom config functions to properly set up streaming for the steps state
     config = copilotkit_customize_config(
         config,
@@ -201,20 +415,43 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
     )
 
     # Bind the tools to the model
-    model_with_tools = model.bind_tools(
-        [
-            *state["copilotkit"]["actions"],
-            DEFINE_TEST_SCRIPT_TOOL
-        ],
-        # Disable parallel tool calls to avoid race conditions
-        parallel_tool_calls=False,
-    )
+    def bind_tools(model: ChatOpenAI):
+        return model.bind_tools(
+            [
+                *state["copilotkit"]["actions"],
+                PLAN_TEST_SUITES_TOOL if TEST_SUITE_FANOUT else DEFINE_TEST_SCRIPT_TOOL
+            ],
+            # Disable parallel tool calls to avoid race conditions
+            parallel_tool_calls=False,
+        )
 
     # Run the model and generate a response
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state["messages"],
-    ], config)
+    try:
+        # Each provider request of the router waits for its own admission slot
+        response = await model_router.ainvoke(
+            bind_tools,
+            [
+                SystemMessage(content=system_prompt),
+                *state["messages"],
+            ],
+            config,
+            # Hedged requests and retries must not stream a second response to the frontend
+            quiet_config=copilotkit_customize_config(config, emit_messages=False, emit_tool_calls=False),
+        )
+    except AdmissionRejected as e:
+        # Shed the request instead of queueing it behind the provider rate limits
+        print(e)
+        with metrics.timer("agent_stage_seconds", node="chat_node", stage="copilotkit_exit"):
+            await copilotkit_exit(config)
+        return Command(
+            goto=END,
+            update={
+                "messages": state["messages"] + [AIMessage(
+                    content="The testing agent is busy right now, please try again in a few seconds."
+                )],
+                "testScripts": state["testScripts"],
+            }
+        )
 
     
     # Update messages with the response
@@ -225,19 +462,39 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
         tool_call = response.tool_calls[0]
         # Extract tool call information
         tool_call_id = ""
-        if hasattr(tool_call, "id"):
-            tool_call_id = tool_call.id
-            tool_call_name = tool_call.name
-            tool_call_args = tool_call.args if not isinstance(tool_call.args, str) else json.loads(tool_call.args)
-        else:
-            tool_call_id = tool_call.get("id", "")
-            tool_call_name = tool_call.get("name", "")
-            args = tool_call.get("args", {})
-            tool_call_args = args if not isinstance(args, str) else json.loads(args)
+        with metrics.timer("agent_stage_seconds", node="chat_node", stage="parse_tool_call"):
+            if hasattr(tool_call, "id"):
+                tool_call_id = tool_call.id
+                tool_call_name = tool_call.name
+                tool_call_args = tool_call.args if not isinstance(tool_call.args, str) else json.loads(tool_call.args)
+            else:
+                tool_call_id = tool_call.get("id", "")
+                tool_call_name = tool_call.get("name", "")
+                args = tool_call.get("args", {})
+                tool_call_args = args if not isinstance(args, str) else json.loads(args)
+        metrics.observe(
+            "agent_tool_call_payload_bytes",
+            len(json.dumps(tool_call_args)),
+            node="chat_node",
+            tool=tool_call_name,
+        )
+
+        if tool_call_name == "plan_test_suites":
+            # Generate the planned test suites concurrently in generate_suites_node
+            return Command(
+                goto="generate_suites_node",
+                update={
+                    "messages": messages,
+                    "testSuitePlan": {**tool_call_args, "tool_call_id": tool_call_id},
+                }
+            )
 
         if tool_call_name == "generate_test_scripts":
-            # Get the steps from the tool call
-            state["testScripts"] = tool_call_args
+            # Get the steps from the tool call and fill in the derived fields
+            with metrics.timer("agent_stage_seconds", node="chat_node", stage="normalize"):
+                state["testScripts"] = normalize_test_scripts(tool_call_args)
+            if test_scripts_key:
+                test_script_cache.set(test_scripts_key, state["testScripts"])
             print(tool_call_args, "tool_call_args")
             tool_response = {
                 "role": "tool",
@@ -257,12 +514,14 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             #     }]
             # }
             messages = messages + [tool_response]
-            await copilotkit_exit(config)
+            with metrics.timer("agent_stage_seconds", node="chat_node", stage="copilotkit_exit"):
+                await copilotkit_exit(config)
             return Command(
                 goto=END,
                 update={
                     "messages": messages,
                     "testScripts": state["testScripts"],
+                    "forceRegenerate": False,
                 }
             )
             testScripts_raw = tool_call_args.get("testSuites", [])
@@ -309,7 +568,8 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
             )
     
     # If no tool calls or not generate_task_steps, return to END with the updated messages
-    await copilotkit_exit(config)
+    with metrics.timer("agent_stage_seconds", node="chat_node", stage="copilotkit_exit"):
+        await copilotkit_exit(config)
     return Command(
         goto=END,
         update={
@@ -319,6 +579,117 @@ async def chat_node(state: Dict[str, Any], config: RunnableConfig):
     )
 
 
+@metrics.node("generate_suites_node")
+async def generate_suites_node(state: Dict[str, Any], config: RunnableConfig):
+    """
+    Generates each planned test suite in its own model call, under a concurrency limit,
+    and merges the results into testScripts.
+    """
+    plan = state.get("testSuitePlan") or {}
+    titles = []
+    seen_titles = set()
+    for title in plan.get("titles") or []:
+        if _normalize_title(title) not in seen_titles:
+            seen_titles.add(_normalize_title(title))
+            titles.append(title)
+    # Each planned title is a paid model call, never generate more suites than requested
+    titles = titles[:max(1, TEST_SUITE_FANOUT_MAX_SUITES)]
+
+    if config is None:
+        config = RunnableConfig(recursion_limit=25)
+
+    # The per-suite calls are internal, only the merged state is sent to the frontend
+    suite_config = copilotkit_customize_config(
+        config,
+        emit_messages=False,
+        emit_tool_calls=False,
+    )
+    def bind_tool(model: ChatOpenAI):
+        return model.bind_tools(
+            [DEFINE_TEST_SUITE_TOOL],
+            tool_choice="generate_test_suite",
+            parallel_tool_calls=False,
+        )
+    semaphore = asyncio.Semaphore(max(1, TEST_SUITE_FANOUT_CONCURRENCY))
+    # Drop the planning response, it has no tool response yet
+    context_messages = state["messages"][:-1]
+
+    async def generate_suite(title: str) -> Dict[str, Any]:
+        suite_prompt = f"""
+    You are a helpful assistant that can perform any task related to software testing and PR validation.
+    You MUST call the `generate_test_suite` function to generate the test suite titled "{title}" for PR "{plan.get("prId", "")}".
+    The other planned test suites are: {", ".join(t for t in titles if t != title)}. Do not repeat their test cases.
+    The test suite should be relevant to the context which is the CopilotKitReadables or PR provided by the user. All the data which involves the user emails should be referred from the CopilotKitReadables.
+    Do not generate IDs, timestamps or test case counts; they are filled in automatically.
+    """
+        async with semaphore:
+            response = await model_router.ainvoke(bind_tool, [
+                SystemMessage(content=suite_prompt),
+                *context_messages,
+            ], suite_config)
+        args = response.tool_calls[0].get("args", {}) if response.tool_calls else {}
+        args = args if not isinstance(args, str) else json.loads(args)
+        return {**args, "title": args.get("title") or title}
+
+    results = await asyncio.gather(*(generate_suite(title) for title in titles), return_exceptions=True)
+    test_suites = []
+    failed_titles = []
+    for title, result in zip(titles, results):
+        if isinstance(result, Exception):
+            print(f"Failed to generate test suite '{title}': {result}")
+            failed_titles.append(title)
+            continue
+        test_suites.append(result)
+
+    with metrics.timer("agent_stage_seconds", node="generate_suites_node", stage="normalize"):
+        test_scripts = normalize_test_scripts({"testSuites": merge_test_suites(test_suites)})
+    metrics.observe(
+        "agent_tool_call_payload_bytes",
+        len(json.dumps(test_scripts)),
+        node="generate_suites_node",
+        tool="generate_test_suite",
+    )
+    if test_script_cache is not None:
+        test_scripts_key = cache_key(state["messages"], state.get("copilotkit", {}).get("context"))
+        # Only complete results are cached, a partial failure should be retried
+        if test_scripts_key and test_scripts["testSuites"] and not failed_titles:
+            test_script_cache.set(test_scripts_key, test_scripts)
+    await copilotkit_emit_state(config, {**state, "testScripts": test_scripts})
+
+    messages = state["messages"]
+    if not test_suites:
+        messages = messages + [
+            {
+                "role": "tool",
+                "content": "Test script generation failed.",
+                "tool_call_id": plan.get("tool_call_id", ""),
+            },
+            AIMessage(content="I could not generate the test suites right now, please try again in a few seconds."),
+        ]
+    else:
+        messages = messages + [{
+            "role": "tool",
+            "content": "Test scripts generated. Allow user to select the test suites they want to run.",
+            "tool_call_id": plan.get("tool_call_id", ""),
+        }]
+        if failed_titles:
+            messages = messages + [AIMessage(content=(
+                f"I generated {len(test_suites)} of {len(titles)} test suites. "
+                f"These could not be generated, ask me to regenerate them: {', '.join(failed_titles)}."
+            ))]
+    with metrics.timer("agent_stage_seconds", node="generate_suites_node", stage="copilotkit_exit"):
+        await copilotkit_exit(config)
+    return Command(
+        goto=END,
+        update={
+            "messages": messages,
+            "testScripts": test_scripts,
+            "testSuitePlan": {},
+            "forceRegenerate": False,
+        }
+    )
+
+
 # async def process_steps_node(state: Dict[str, Any], config: RunnableConfig):
 #     """
 #     This node handles the user interrupt for step customization and generates the final response.
@@ -373,6 +744,7 @@ workflow = StateGraph(AgentState)
 # Add nodes
 workflow.add_node("start_flow", start_flow)
 workflow.add_node("chat_node", chat_node)
+workflow.add_node("generate_suites_node", generate_suites_node)
 # workflow.add_node("process_steps_node", process_steps_node)
 
 # Add edges
@@ -382,6 +754,7 @@ workflow.add_edge("start_flow", "chat_node")
 # workflow.add_edge("chat_node", "process_steps_node") # Removed unconditional edge
 # workflow.add_edge("process_steps_node", END)
 workflow.add_edge("chat_node", END)                 # Removed unconditional edge
+workflow.add_edge("generate_suites_node", END)
 
 # Add conditional edges from chat_node
 # def should_continue(command: Command):
@@ -399,10 +772,70 @@ workflow.add_edge("chat_node", END)                 # Removed unconditional edge
 #     },
 # )
 
-# Compile the graph
-testing_graph = workflow.compile(checkpointer=MemorySaver())
+# Shared checkpoint store, so any worker can resume any thread
+CHECKPOINT_POSTGRES_URI = os.getenv("CHECKPOINT_POSTGRES_URI")
+CHECKPOINT_POOL_SIZE = int(os.getenv("CHECKPOINT_POOL_SIZE", "10"))
+
+@asynccontextmanager
+async def postgres_checkpointer():
+    """
+    Open the Postgres checkpointer of this worker and close its connection pool on exit.
+    The saver binds to the running event loop, so it is created in the worker's lifespan, not at import.
+    """
+    from psycopg_pool import AsyncConnectionPool
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+    pool = AsyncConnectionPool(
+        conninfo=CHECKPOINT_POSTGRES_URI,
+        max_size=CHECKPOINT_POOL_SIZE,
+        kwargs={"autocommit": True, "prepare_threshold": 0},
+        open=False,
+    )
+    # Waits until the pool has opened its minimum number of connections
+    await pool.open(wait=True)
+    try:
+        yield AsyncPostgresSaver(pool)
+    finally:
+        await pool.close()
+
+async def setup_checkpoint_store():
+    """
+    Create or migrate the checkpoint tables. Runs once before the workers start,
+    so they do not race on the migrations.
+    """
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 
-app = FastAPI()
+    async with AsyncPostgresSaver.from_conn_string(CHECKPOINT_POSTGRES_URI) as saver:
+        await saver.setup()
+
+# Compile the graph. Without a shared store thread state is kept in process memory,
+# otherwise the Postgres checkpointer is attached on startup.
+testing_graph = workflow.compile(checkpointer=None if CHECKPOINT_POSTGRES_URI else MemorySaver())
+
+async def warm_up():
+    """
+    Open the connections to the model provider and build the graph before the worker accepts requests.
+    """
+    for name in model_router.model_names:
+        # Open the HTTP connection to the provider with a cheap request
+        try:
+            await model_router.create_model(name).root_async_client.models.retrieve(name)
+        except Exception as e:
+            print(f"Warm-up request to {name} failed: {e!r}")
+    testing_graph.get_graph()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up the worker before it accepts requests and release its connections on shutdown.
+    """
+    async with postgres_checkpointer() if CHECKPOINT_POSTGRES_URI else nullcontext() as checkpointer:
+        if checkpointer is not None:
+            testing_graph.checkpointer = checkpointer
+        await warm_up()
+        yield
+
+app = FastAPI(lifespan=lifespan)
 
 sdk = CopilotKitSDK(
     agents=[
@@ -416,9 +849,63 @@ sdk = CopilotKitSDK(
 
 add_fastapi_endpoint(app, sdk, "/copilotkit")
 
+@app.middleware("http")
+async def admit_request(request: Request, call_next):
+    """
+    Tag the request with its tenant and reject it right away when the admission queue is full.
+    """
+    if admission is None or not request.url.path.startswith("/copilotkit"):
+        return await call_next(request)
+    tenant = request.headers.get(ADMISSION_TENANT_HEADER)
+    if tenant not in ADMISSION_TENANTS:
+        tenant = "default"
+    if admission.is_saturated():
+        metrics.increment("agent_admission_rejected_total", reason="queue_full", tenant=tenant)
+        return JSONResponse(
+            {"error": "The testing agent is busy, please retry shortly."},
+            status_code=429,
+            headers={"Retry-After": str(int(admission.queue_timeout))},
+        )
+    current_tenant.set(tenant)
+    return await call_next(request)
+
+# Registered last so it is the outermost middleware and also records the requests rejected by admission
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Record the wall time of every agent request, including the streamed response body.
+    """
+    if not request.url.path.startswith("/copilotkit"):
+        return await call_next(request)
+    start = time.perf_counter()
+    response = await call_next(request)
+    body_iterator = response.body_iterator
+    # Label with the route template rather than the raw path, which embeds thread and agent names
+    route = getattr(request.scope.get("route"), "path", "/copilotkit")
+
+    async def timed_body_iterator():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            metrics.observe("agent_request_seconds", time.perf_counter() - start, path=route)
+            metrics.increment("agent_requests_total", path=route, status=response.status_code)
+
+    response.body_iterator = timed_body_iterator()
+    return response
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Expose the agent metrics of this worker in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 def main():
     """Run the uvicorn server."""
     port = int(os.getenv("PORT", "8000"))
+    if CHECKPOINT_POSTGRES_URI:
+        asyncio.run(setup_checkpoint_store())
     uvicorn.run(
         "agent:app",
         host="0.0.0.0",
@@ -426,5 +913,33 @@ def main():
         reload=True,
     )
 
+def serve():
+    """
+    Run the uvicorn server for production with multiple workers.
+    Without a shared checkpoint store a single worker is run, since threads can only be resumed
+    by the worker that created them.
+    In-flight requests are drained for GRACEFUL_SHUTDOWN_TIMEOUT seconds on shutdown.
+    """
+    port = int(os.getenv("PORT", "8000"))
+    if CHECKPOINT_POSTGRES_URI:
+        asyncio.run(setup_checkpoint_store())
+        workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+    else:
+        workers = 1
+        if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            print("CHECKPOINT_POSTGRES_URI is not set, ignoring WEB_CONCURRENCY and running a single worker")
+    limit_concurrency = os.getenv("LIMIT_CONCURRENCY")
+    uvicorn.run(
+        "agent:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "75")),
+        limit_concurrency=int(limit_concurrency) if limit_concurrency else None,
+        backlog=int(os.getenv("BACKLOG", "2048")),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+        proxy_headers=True,
+    )
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
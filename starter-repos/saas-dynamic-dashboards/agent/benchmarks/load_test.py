@@ -0,0 +1,178 @@
+"""
+Load test driver for the agent's /copilotkit endpoint.
+Run the agent against the mock LLM (benchmarks/mock_llm.py) to measure the agent's own limits.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 32 --requests 500 --threads 100 --server-pid <uvicorn pid>
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+# psutil is optional, /proc is read directly on Linux without it
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def worker_pids(server_pid: int) -> List[int]:
+    """
+    Return the server process and its worker processes.
+    """
+    if psutil is not None:
+        process = psutil.Process(server_pid)
+        return [server_pid] + [child.pid for child in process.children(recursive=True)]
+    pids = [server_pid]
+    for children in Path(f"/proc/{server_pid}/task").glob("*/children"):
+        pids += [int(pid) for pid in children.read_text().split()]
+    return pids
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.NoSuchProcess:
+            return None
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def sample_rss(pids: List[int]) -> Dict[int, int]:
+    samples = {pid: rss_bytes(pid) for pid in pids}
+    return {pid: rss for pid, rss in samples.items() if rss is not None}
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def is_complete_run(last_line: str) -> bool:
+    """
+    A run is complete when the stream ends with the final state sync of the agent.
+    The status code is sent before the stream, so an agent error only shows up as a truncated stream.
+    """
+    try:
+        event = json.loads(last_line)
+    except ValueError:
+        return False
+    return event.get("event") == "on_copilotkit_state_sync" and not event.get("active")
+
+
+def request_body(agent: str, thread_id: str, message: str) -> Dict:
+    return {
+        "name": agent,
+        "threadId": thread_id,
+        "nodeName": None,
+        "state": {},
+        "messages": [{
+            "id": str(uuid.uuid4()),
+            "type": "TextMessage",
+            "role": "user",
+            "content": message,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }],
+        "actions": [],
+    }
+
+
+async def run(args) -> Dict:
+    thread_ids = [str(uuid.uuid4()) for _ in range(args.threads)]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(thread_ids[index % len(thread_ids)])
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        async def worker():
+            while True:
+                try:
+                    thread_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    last_line = ""
+                    async with client.stream("POST", args.url, json=request_body(args.agent, thread_id, args.message)) as response:
+                        async for line in response.aiter_lines():
+                            if line.strip():
+                                last_line = line
+                    if response.status_code >= 400:
+                        errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+                        continue
+                    if not is_complete_run(last_line):
+                        errors["incomplete_stream"] = errors.get("incomplete_stream", 0) + 1
+                        continue
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError as e:
+                    # Including RemoteProtocolError and ReadError of a stream cut off by the server
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {"latencies": latencies, "errors": errors, "elapsed": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the agent's /copilotkit endpoint")
+    parser.add_argument("--url", default=os.getenv("AGENT_URL", "http://localhost:8000/copilotkit/agents/execute"))
+    parser.add_argument("--agent", default="testing_agent")
+    parser.add_argument("--message", default="Generate test scripts for PR81")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=50, help="Number of distinct thread IDs")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--server-pid", type=int, help="PID of the agent server to report worker RSS growth")
+    args = parser.parse_args()
+
+    pids = worker_pids(args.server_pid) if args.server_pid else []
+    rss_before = sample_rss(pids)
+
+    result = asyncio.run(run(args))
+
+    latencies = result["latencies"]
+    print(f"🚀 {len(latencies)} ok / {args.requests} requests in {result['elapsed']:.2f}s "
+          f"at concurrency {args.concurrency} over {args.threads} threads")
+    print(f"   Throughput: {len(latencies) / result['elapsed']:.2f} req/s")
+    if latencies:
+        print(f"   Latency: mean {statistics.mean(latencies):.3f}s | "
+              f"p50 {percentile(latencies, 0.5):.3f}s | p95 {percentile(latencies, 0.95):.3f}s | "
+              f"p99 {percentile(latencies, 0.99):.3f}s | max {max(latencies):.3f}s")
+    if result["errors"]:
+        print(f"   Errors: {', '.join(f'{name}: {count}' for name, count in result['errors'].items())}")
+
+    if pids:
+        rss_after = sample_rss(pids)
+        print("   Worker RSS:")
+        for pid, before in rss_before.items():
+            after = rss_after.get(pid)
+            if after is None:
+                print(f"      {pid}: exited")
+                continue
+            print(f"      {pid}: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB "
+                  f"({(after - before) / 2**20:+.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+A local OpenAI-compatible mock of the chat completions API for load testing the agent.
+It answers tool calls for generate_test_scripts, generate_test_suite and plan_test_suites
+with canned arguments, with a configurable latency and token streaming rate.
+
+Usage:
+    python benchmarks/mock_llm.py --port 9000 --latency 0.5 --tokens-per-second 200
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=mock python agent.py
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+settings = {
+    "latency": 0.5,
+    "tokens_per_second": 200.0,
+    "suites": 4,
+    "test_cases": 3,
+}
+
+# Roughly the number of characters per streamed token
+CHARS_PER_TOKEN = 4
+
+
+def canned_test_suite(index: int) -> Dict[str, Any]:
+    return {
+        "prId": "PR81",
+        "title": f"Mock Test Suite {index + 1}",
+        "status": "idle",
+        "shortDescription": "A canned test suite generated by the mock LLM.",
+        "testCases": [
+            {
+                "name": f"Mock test case {index + 1}.{case + 1}",
+                "status": "pending",
+                "executionTime": "1.2s",
+                "environment": "staging",
+                "browser": "Chrome",
+                "testSteps": ["Open the page", "Perform the action", "Verify the result"],
+            }
+            for case in range(settings["test_cases"])
+        ],
+        "coverage": 80,
+        "executedBy": "jane.smith@got.com",
+    }
+
+
+def canned_arguments(tool_name: str) -> Dict[str, Any]:
+    if tool_name == "plan_test_suites":
+        return {"prId": "PR81", "titles": [f"Mock Test Suite {index + 1}" for index in range(settings["suites"])]}
+    if tool_name == "generate_test_suite":
+        return canned_test_suite(0)
+    return {"testSuites": [canned_test_suite(index) for index in range(settings["suites"])]}
+
+
+def pick_tool(body: Dict[str, Any]) -> Optional[str]:
+    """
+    Call the forced tool, otherwise the first of the agent's own tools that is offered.
+    """
+    tool_choice = body.get("tool_choice")
+    if isinstance(tool_choice, dict):
+        return tool_choice.get("function", {}).get("name")
+    names = [tool.get("function", {}).get("name") for tool in body.get("tools") or []]
+    for name in ("generate_test_scripts", "plan_test_suites", "generate_test_suite"):
+        if name in names:
+            return name
+    return None
+
+
+def split_tokens(text: str) -> List[str]:
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)] or [""]
+
+
+def usage(body: Dict[str, Any], completion: str) -> Dict[str, int]:
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // CHARS_PER_TOKEN
+    completion_tokens = len(completion) // CHARS_PER_TOKEN
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def chunk(completion_id: str, model: str, delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        **extra,
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.get("/v1/models/{model}")
+async def retrieve_model(model: str):
+    """
+    Answer the agent's warm-up request.
+    """
+    return {"id": model, "object": "model", "created": int(time.time()), "owned_by": "mock"}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4o-mini")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    tool_name = pick_tool(body)
+    tool_call_id = f"call_{uuid.uuid4().hex[:24]}"
+    text = json.dumps(canned_arguments(tool_name)) if tool_name else "The mock LLM generated the test scripts."
+    token_delay = 1 / settings["tokens_per_second"] if settings["tokens_per_second"] > 0 else 0
+
+    await asyncio.sleep(settings["latency"])
+
+    if not body.get("stream"):
+        await asyncio.sleep(token_delay * len(split_tokens(text)))
+        message = {"role": "assistant", "content": None if tool_name else text}
+        if tool_name:
+            message["tool_calls"] = [{
+                "id": tool_call_id,
+                "type": "function",
+                "function": {"name": tool_name, "arguments": text},
+            }]
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_name else "stop"}],
+            "usage": usage(body, text),
+        })
+
+    async def stream():
+        if tool_name:
+            yield chunk(completion_id, model, {"role": "assistant", "content": None, "tool_calls": [{
+                "index": 0,
+                "id": tool_call_id,
+                "type": "function",
+                "function": {"name": tool_name, "arguments": ""},
+            }]})
+        else:
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+        for token in split_tokens(text):
+            await asyncio.sleep(token_delay)
+            if tool_name:
+                yield chunk(completion_id, model, {"tool_calls": [{"index": 0, "function": {"arguments": token}}]})
+            else:
+                yield chunk(completion_id, model, {"content": token})
+        yield chunk(completion_id, model, {}, "tool_calls" if tool_name else "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": usage(body, text),
+            }
+            yield f"data: {json.dumps(payload)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM for load testing the agent")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Token streaming rate, 0 for no delay")
+    parser.add_argument("--suites", type=int, default=4, help="Test suites per generate_test_scripts call")
+    parser.add_argument("--test-cases", type=int, default=3, help="Test cases per test suite")
+    args = parser.parse_args()
+
+    settings.update(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        suites=args.suites,
+        test_cases=args.test_cases,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
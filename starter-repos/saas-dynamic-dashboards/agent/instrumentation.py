@@ -0,0 +1,206 @@
+"""
+Latency, token and payload instrumentation for the testing agent.
+Metrics are kept per worker process and rendered in the Prometheus text format.
+"""
+import os
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# OpenTelemetry is optional, spans are only created when it is installed and enabled
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+OTEL_SPANS = os.getenv("AGENT_OTEL_SPANS", "false").lower() in ("1", "true", "yes")
+METRICS_WINDOW = int(os.getenv("AGENT_METRICS_WINDOW", "1024"))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class LatencyStats:
+    """
+    Count, sum and quantiles over a sliding window of the most recent observations.
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AgentMetrics:
+    """
+    In-process registry of summaries and counters, labelled by node, stage and model.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._summaries: Dict[str, Dict[Labels, LatencyStats]] = defaultdict(lambda: defaultdict(LatencyStats))
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            self._summaries[name][self._labels(labels)].observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[name][self._labels(labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[name][self._labels(labels)] = value
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Record the wall time of the block in seconds, and wrap it in a span when enabled.
+        """
+        start = time.perf_counter()
+        with span(name, **labels):
+            try:
+                yield
+            finally:
+                self.observe(name, time.perf_counter() - start, **labels)
+
+    def node(self, node_name: str):
+        """
+        Decorator recording the wall time of a LangGraph node.
+        """
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.timer("agent_node_seconds", node=node_name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        Every series is labelled with the pid of the worker, so the series of the workers do not collide.
+        """
+        pid = str(os.getpid())
+
+        def format_labels(labels: Labels, **extra) -> str:
+            pairs = list(labels) + [(key, str(value)) for key, value in extra.items()] + [("pid", pid)]
+            return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._summaries.items()):
+                lines.append(f"# TYPE {name} summary")
+                for labels, stats in series.items():
+                    for q in QUANTILES:
+                        lines.append(f"{name}{format_labels(labels, quantile=q)} {stats.quantile(q):.6f}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {stats.total:.6f}")
+                    lines.append(f"{name}_count{format_labels(labels)} {stats.count}")
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{format_labels(labels)} {value:g}")
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in series.items():
+                    lines.append(f"{name}{format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def span(name: str, **attributes):
+    """
+    Start an OpenTelemetry span when AGENT_OTEL_SPANS is enabled and opentelemetry is installed.
+    """
+    if not OTEL_SPANS or trace is None:
+        return nullcontext()
+    return trace.get_tracer("testing_agent").start_as_current_span(name, attributes=attributes)
+
+
+class ModelCallMetrics(AsyncCallbackHandler):
+    """
+    Callback handler recording model latency, time-to-first-token and token usage per node.
+    """
+
+    def __init__(self, registry: AgentMetrics):
+        self.registry = registry
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs):
+        metadata = metadata or {}
+        self._runs[run_id] = {
+            "start": time.perf_counter(),
+            "first_token": None,
+            "node": metadata.get("langgraph_node", "unknown"),
+            "model": metadata.get("ls_model_name", "unknown"),
+        }
+
+    async def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run["first_token"] is None:
+            run["first_token"] = time.perf_counter()
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        labels = {"node": run["node"], "model": run["model"]}
+        end = time.perf_counter()
+        self.registry.observe("agent_model_call_seconds", end - run["start"], **labels)
+        # Calls that are not streamed have no first token
+        if run["first_token"] is not None:
+            self.registry.observe("agent_model_ttft_seconds", run["first_token"] - run["start"], **labels)
+
+        prompt_tokens, completion_tokens = _token_usage(response)
+        self.registry.increment("agent_prompt_tokens_total", prompt_tokens, **labels)
+        self.registry.increment("agent_completion_tokens_total", completion_tokens, **labels)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            self.registry.increment("agent_model_errors_total", node=run["node"], model=run["model"])
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    """
+    Read prompt and completion tokens from the message usage metadata, or the provider token usage.
+    """
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+
+
+metrics = AgentMetrics()
+model_call_metrics = ModelCallMetrics(metrics)
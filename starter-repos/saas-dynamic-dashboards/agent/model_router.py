@@ -0,0 +1,229 @@
+"""
+Latency-aware routing of the agent's model calls.
+Each call runs under a per-model deadline, falls back to the next model when it fails or times out,
+and can be hedged with a duplicate request on the next model after a p95-based delay.
+Models that are not tried first can be probed periodically with shadow requests, so their latency
+stays known without hedging. The failures of a demoted model expire, so it is tried again.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from admission import AdmissionRejected
+from instrumentation import metrics
+
+
+class ModelStats:
+    """
+    Latency and outcomes of the recent calls of a model. Samples older than max_age seconds are
+    dropped, so the failures of a demoted model expire.
+    """
+
+    def __init__(self, window: int = 200, max_age: float = 600.0):
+        self.max_age = max_age
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.last_call = time.monotonic()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.max_age
+        for samples in (self.latencies, self.outcomes):
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+
+    def record(self, latency: Optional[float], ok: bool):
+        now = time.monotonic()
+        if ok and latency is not None:
+            self.latencies.append((now, latency))
+        self.outcomes.append((now, ok))
+
+    def record_censored(self, latency: float):
+        """
+        Record the losing request of a hedge, cancelled after latency seconds. Its latency is only
+        known to be at least that long, so it is counted as a latency sample but not as an outcome.
+        """
+        self.latencies.append((time.monotonic(), latency))
+
+    @property
+    def samples(self) -> int:
+        self._expire()
+        return len(self.outcomes)
+
+    def p95(self) -> Optional[float]:
+        self._expire()
+        if not self.latencies:
+            return None
+        ordered = sorted(latency for _, latency in self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def error_rate(self) -> float:
+        self._expire()
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+
+class ModelRouter:
+    """
+    Routes model calls over an ordered list of models, e.g. gpt-4o-mini with gpt-4o as secondary.
+    """
+
+    def __init__(self, model_names: List[str], create_model: Callable[[str], Any],
+                 timeouts: Optional[Dict[str, float]] = None, default_timeout: float = 90.0,
+                 hedge: bool = False, hedge_min_delay: float = 2.0,
+                 min_samples: int = 20, max_error_rate: float = 0.5, probe_interval: Optional[float] = None,
+                 admit: Optional[Callable[[], AsyncContextManager]] = None):
+        self.model_names = model_names
+        self.create_model = lru_cache(maxsize=None)(create_model)
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        # Probing is opt-in, since every probe is an extra provider request
+        self.probe_interval = probe_interval
+        self._probes = set()
+        # Every provider request, including a hedge, takes its own admission slot
+        self.admit = admit or nullcontext
+        self.stats = {name: ModelStats() for name in model_names}
+
+    def timeout(self, name: str) -> float:
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _healthy(self, name: str) -> bool:
+        stats = self.stats[name]
+        return stats.samples < self.min_samples or stats.error_rate() <= self.max_error_rate
+
+    def ranked(self) -> List[str]:
+        """
+        Order the models by their p95 latency, penalized by their error rate, once every model has
+        enough samples. Until then keep the configured order and only demote models that keep failing.
+        """
+        if all(self.stats[name].samples >= self.min_samples and self.stats[name].p95() for name in self.model_names):
+            return sorted(
+                self.model_names,
+                key=lambda name: (not self._healthy(name), self.stats[name].p95() * (1 + self.stats[name].error_rate())),
+            )
+        return sorted(self.model_names, key=lambda name: not self._healthy(name))
+
+    def _due_probe(self, ranked: List[str]) -> Optional[str]:
+        """
+        Return a healthy model that was not called for probe_interval seconds and is not tried first.
+        The model is stamped right away, so concurrent requests do not all pick it.
+        """
+        if self.probe_interval is None:
+            return None
+        now = time.monotonic()
+        for name in ranked[1:]:
+            if self._healthy(name) and now - self.stats[name].last_call >= self.probe_interval:
+                self.stats[name].last_call = now
+                return name
+        return None
+
+    def _probe(self, name: str, bind: Callable[[Any], Runnable], messages: List[Any]):
+        """
+        Send a shadow copy of the request to the model in the background, only to sample its latency.
+        It runs outside the graph run, so nothing is streamed and the user response does not wait for it.
+        """
+        metrics.increment("agent_router_probes_total", model=name)
+        config = RunnableConfig(metadata={"langgraph_node": "router_probe"})
+        task = asyncio.ensure_future(self._call(name, bind, messages, config))
+        self._probes.add(task)
+        task.add_done_callback(self._probe_done)
+
+    def _probe_done(self, task: asyncio.Future):
+        self._probes.discard(task)
+        # The outcome is already recorded in the stats, retrieve the error so it is not logged as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    def hedge_delay(self, name: str) -> float:
+        p95 = self.stats[name].p95()
+        if p95 is None or self.stats[name].samples < self.min_samples:
+            return max(self.hedge_min_delay, self.timeout(name) / 2)
+        return max(self.hedge_min_delay, p95)
+
+    async def _call(self, name: str, bind: Callable[[Any], Runnable], messages: List[Any], config: RunnableConfig):
+        async with self.admit():
+            return await self._timed_call(name, bind, messages, config)
+
+    async def _timed_call(self, name: str, bind: Callable[[Any], Runnable], messages: List[Any], config: RunnableConfig):
+        self.stats[name].last_call = time.monotonic()
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                bind(self.create_model(name)).ainvoke(messages, config),
+                self.timeout(name),
+            )
+        except asyncio.CancelledError:
+            # The losing request of a hedge took at least this long
+            self.stats[name].record_censored(time.perf_counter() - start)
+            raise
+        except Exception as e:
+            self.stats[name].record(None, False)
+            reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            metrics.increment("agent_router_failures_total", model=name, reason=reason)
+            print(f"Model call to {name} failed ({reason}): {e!r}")
+            raise
+        self.stats[name].record(time.perf_counter() - start, True)
+        return response
+
+    async def ainvoke(self, bind: Callable[[Any], Runnable], messages: List[Any], config: RunnableConfig,
+                      quiet_config: Optional[RunnableConfig] = None):
+        """
+        Run the call on the best ranked model, and send a shadow request to a model that is due for a probe.
+        The retries run with quiet_config, so they do not stream a second response to the frontend.
+        With hedging enabled every request runs with quiet_config, since the winner is not known
+        while the responses stream.
+        Raises AdmissionRejected when the first request is not admitted.
+        """
+        quiet_config = quiet_config or config
+        ranked = self.ranked()
+        probe = self._due_probe(ranked)
+        if probe is not None:
+            self._probe(probe, bind, messages)
+        primary, fallbacks = ranked[0], ranked[1:]
+        tried = [primary]
+        primary_config = quiet_config if self.hedge and fallbacks else config
+        pending = {asyncio.ensure_future(self._call(primary, bind, messages, primary_config))}
+        last_error: Optional[BaseException] = None
+
+        try:
+            if self.hedge and fallbacks:
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay(primary))
+                if not done:
+                    tried.append(fallbacks[0])
+                    metrics.increment("agent_router_hedges_total", model=fallbacks[0])
+                    pending.add(asyncio.ensure_future(self._call(fallbacks[0], bind, messages, quiet_config)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    if isinstance(task.exception(), AdmissionRejected) and last_error is not None:
+                        # A rejected hedge does not hide the error of the first request
+                        continue
+                    last_error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if isinstance(last_error, AdmissionRejected):
+            raise last_error
+
+        for name in fallbacks:
+            if name in tried:
+                continue
+            metrics.increment("agent_router_retries_total", model=name)
+            try:
+                return await self._call(name, bind, messages, quiet_config)
+            except Exception as e:
+                last_error = e
+        raise last_error
@@ -0,0 +1,125 @@
+"""
+Opt-in cache of generated test scripts, keyed on the readable context and the user request.
+The cache is kept per worker process.
+"""
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# "regenerate", "re-generated", "regenerating", ... and "redo", "re-do", "redone", ...
+_REGENERATE_VERB = r"(?:re-?generat(?:e|es|ed|ing)|re-?do(?:es|ne|ing)?)"
+_REGENERATE_TARGET = r"(?:tests?|test\s+(?:scripts?|suites?|cases?)|scripts?|suites?|them|these|those|it)"
+# Only a regenerate request when the verb applies to the test scripts ("redo the tests", "tests regenerated")
+# or makes up the whole request ("regenerate please"), not when it is part of the content ("the 'redone' flag")
+REGENERATE_REQUEST_PATTERN = re.compile(
+    rf"\b(?P<verb>{_REGENERATE_VERB})(?:\s+[\w-]+){{0,3}}?\s+{_REGENERATE_TARGET}\b"
+    rf"|\b{_REGENERATE_TARGET}\s+(?:(?:be|get|been|are)\s+)?(?P<passive>{_REGENERATE_VERB})\b"
+    rf"|^(?:please\s+)?(?P<bare>{_REGENERATE_VERB})(?:\s+(?:them|please|again))*\W*$",
+    re.IGNORECASE,
+)
+
+
+class TestScriptCache:
+    """
+    LRU cache with a time-to-live for the testScripts of a generate_test_scripts request.
+    """
+
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _message_role(message: Any) -> str:
+    if isinstance(message, dict):
+        return message.get("role") or message.get("type", "")
+    return getattr(message, "type", "")
+
+
+def _message_text(message: Any) -> str:
+    content = message.get("content", "") if isinstance(message, dict) else getattr(message, "content", "")
+    if isinstance(content, list):
+        content = " ".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return " ".join(str(content).lower().split())
+
+
+def last_user_request(messages: List[Any]) -> str:
+    """
+    Return the normalized text of the most recent user message.
+    """
+    for message in reversed(messages):
+        if _message_role(message) in ("human", "user"):
+            return _message_text(message)
+    return ""
+
+
+def strip_regenerate_intent(request: str) -> str:
+    """
+    Remove the regenerate intent from a normalized request, so "regenerate the test scripts"
+    maps to the same key as "generate the test scripts".
+    """
+    match = REGENERATE_REQUEST_PATTERN.search(request)
+    if match is None:
+        return request
+    group = next(name for name in ("verb", "passive", "bare") if match.group(name))
+    start, end = match.span(group)
+    verb = match.group(group)
+    # "regenerated" -> "generated", "redo" -> "generate"
+    replacement = re.sub(r"^re-?", "", verb) if "generat" in verb else "generate"
+    return " ".join((request[:start] + replacement + request[end:]).split())
+
+
+def cache_key(messages: List[Any], context: Any = None) -> Optional[str]:
+    """
+    Hash the readable context (system messages and CopilotKit context) together with the latest user request.
+    The regenerate intent is stripped, so a forced regeneration overwrites the entry of the original request.
+    Returns None when there is no user request to key on.
+    """
+    request = strip_regenerate_intent(last_user_request(messages))
+    if not request:
+        return None
+    readables = [_message_text(message) for message in messages if _message_role(message) == "system"]
+    payload = json.dumps(
+        {"context": context, "readables": readables, "request": request},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_forced_regenerate(messages: List[Any]) -> bool:
+    """
+    A user can bypass the cache by asking to regenerate or redo the test scripts.
+    """
+    return bool(REGENERATE_REQUEST_PATTERN.search(last_user_request(messages)))
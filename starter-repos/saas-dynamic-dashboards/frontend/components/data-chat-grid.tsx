@@ -107,7 +107,7 @@ export function ChatGrid({ status, state, testSuite, setTestSuite, testCaseStatu
                                             <div className="font-semibold mb-2">Test Cases Details:</div>
                                             <ul className="space-y-4">
                                                 {script.testCases.map((tc, idx) => (
-                                                    <li key={tc.id} className="border rounded p-3 bg-white dark:bg-[#232b3b]">
+                                                    <li key={tc.id ?? idx} className="border rounded p-3 bg-white dark:bg-[#232b3b]">
                                                         <div className="mb-1 flex items-center gap-2">
                                                             <StatusBadge status={testCaseStatus[index]?.[idx] || tc.status} />
                                                             <span className="font-semibold">{tc.name}</span>